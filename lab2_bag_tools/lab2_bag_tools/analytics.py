@@ -0,0 +1,318 @@
+"""
+Command-to-motion analytics over a directory of bags.
+
+For every bag, ``/turtle1/cmd_vel`` commands are lined up with the ``/turtle1/pose``
+responses using a backward merge-asof join on the timestamps: each pose is paired with the
+most recent command, as long as that command is younger than turtlesim's one second
+command timeout. From the join the pipeline computes
+
+* the command-to-motion latency: the time from each command to the first pose whose
+  reported velocities match it,
+* the path length travelled by the turtle, and
+* the velocity tracking error between the reported and the commanded velocities.
+
+Each bag is streamed in fixed-size batches, carrying only the latest command and pose from
+one batch to the next, so poses are never held in memory beyond their batch. The
+per-command latency table is kept for the whole bag, though, and grows with the number of
+commands; it is sent back from the worker processes with the summary. Bags are
+independent, so a directory of bags is processed in a process pool.
+"""
+
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import csv
+import math
+from pathlib import Path
+import sys
+from typing import Optional
+
+from lab2_bag_tools.cdr import decode_batch
+from lab2_bag_tools.reader import BagReader, METADATA_FILENAME
+import numpy as np
+
+CMD_TOPIC = '/turtle1/cmd_vel'
+POSE_TOPIC = '/turtle1/pose'
+
+# turtlesim stops the turtle when no command has been received for this long
+COMMAND_TIMEOUT = 1_000_000_000
+
+# Reported and commanded velocities closer than this are considered equal
+VELOCITY_TOLERANCE = 1e-3
+
+# Number of messages read and decoded at a time
+BATCH_SIZE = 4096
+
+SUMMARY_FIELDS = [
+    'bag', 'cmd_count', 'pose_count', 'duration_s', 'path_length',
+    'latency_mean_s', 'latency_median_s', 'latency_max_s', 'unmatched_commands',
+    'linear_rmse', 'angular_rmse', 'error',
+]
+
+COMMAND_FIELDS = ['timestamp', 'linear_x', 'linear_y', 'angular_z', 'latency_s']
+_COMMAND_DTYPE = np.dtype([('timestamp', 'i8'), ('linear_x', 'f8'), ('linear_y', 'f8'),
+                           ('angular_z', 'f8'), ('latency_s', 'f8')])
+
+
+def merge_asof(left: np.ndarray, right: np.ndarray, tolerance: Optional[int] = None,
+               direction: str = 'backward') -> np.ndarray:
+    """
+    Match each left timestamp with the nearest right timestamp in one direction.
+
+    Both arrays must be sorted. This is the index-producing half of ``pandas.merge_asof``.
+
+    Args:
+        left: The timestamps to match.
+        right: The timestamps to match against.
+        tolerance: Maximum distance between matched timestamps, or None for no limit.
+        direction: ``backward`` to match the last right timestamp at or before each left
+            one, ``forward`` to match the first one at or after it.
+
+    Returns:
+        np.ndarray: For each left timestamp, the index into ``right`` or -1 if there is no
+        match.
+    """
+    if direction == 'backward':
+        idx = np.searchsorted(right, left, side='right') - 1
+        found = idx >= 0
+    elif direction == 'forward':
+        idx = np.searchsorted(right, left, side='left')
+        found = idx < len(right)
+    else:
+        raise ValueError(f'Unknown direction {direction!r}')
+
+    if len(right) == 0:
+        return np.full(len(left), -1, dtype=np.intp)
+    if tolerance is not None:
+        found &= np.abs(left - right[np.where(found, idx, 0)]) <= tolerance
+    return np.where(found, idx, -1)
+
+
+class _BagMetrics:
+    """Running metrics of one bag, updated one batch at a time."""
+
+    def __init__(self):
+        self.first_timestamp: Optional[int] = None
+        self.last_timestamp: Optional[int] = None
+        self.cmd_count = 0
+        self.pose_count = 0
+        self.path_length = 0.0
+        self.linear_sq_error = 0.0
+        self.angular_sq_error = 0.0
+
+        # The latest command is carried into the next batch, because later poses may
+        # still respond to it. Earlier commands are final and moved to the table below.
+        self.carry_cmd = np.empty(0, dtype=_COMMAND_DTYPE)
+        self.commands: list = []
+        self.last_xy: Optional[tuple] = None
+
+    def update(self, cmd_ts: np.ndarray, cmd: dict, pose_ts: np.ndarray, pose: dict) -> None:
+        """Fold one time-ordered batch of decoded commands and poses into the metrics."""
+        for ts in (cmd_ts, pose_ts):
+            if len(ts):
+                first, last = int(ts[0]), int(ts[-1])
+                if self.first_timestamp is None or first < self.first_timestamp:
+                    self.first_timestamp = first
+                if self.last_timestamp is None or last > self.last_timestamp:
+                    self.last_timestamp = last
+        self.cmd_count += len(cmd_ts)
+        self.pose_count += len(pose_ts)
+
+        new = np.empty(len(cmd_ts), dtype=_COMMAND_DTYPE)
+        if len(cmd_ts):
+            new['timestamp'] = cmd_ts
+            new['linear_x'] = cmd['linear_x']
+            new['linear_y'] = cmd['linear_y']
+            new['angular_z'] = cmd['angular_z']
+            new['latency_s'] = np.nan
+        commands = np.concatenate([self.carry_cmd, new])
+
+        if len(pose_ts):
+            self._update_poses(commands, pose_ts, pose)
+
+        if len(commands):
+            self.commands.append(commands[:-1])
+            self.carry_cmd = commands[-1:]
+
+    def _update_poses(self, commands: np.ndarray, pose_ts: np.ndarray, pose: dict) -> None:
+        x = pose['x'].astype(np.float64)
+        y = pose['y'].astype(np.float64)
+        if self.last_xy is not None:
+            x = np.concatenate([[self.last_xy[0]], x])
+            y = np.concatenate([[self.last_xy[1]], y])
+        self.path_length += float(np.hypot(np.diff(x), np.diff(y)).sum())
+        self.last_xy = (x[-1], y[-1])
+
+        # Pair every pose with the command in force when it was published. Poses with no
+        # command in the last COMMAND_TIMEOUT should report a stopped turtle. turtlesim
+        # reports the speed, hypot(linear.x, linear.y), which is never negative.
+        idx = merge_asof(pose_ts, commands['timestamp'], COMMAND_TIMEOUT)
+        active = idx >= 0
+        expected_linear = np.zeros(len(pose_ts))
+        expected_angular = np.zeros(len(pose_ts))
+        expected_linear[active] = np.hypot(commands['linear_x'][idx[active]],
+                                           commands['linear_y'][idx[active]])
+        expected_angular[active] = commands['angular_z'][idx[active]]
+        linear_error = pose['linear_velocity'] - expected_linear
+        angular_error = pose['angular_velocity'] - expected_angular
+        self.linear_sq_error += float(np.square(linear_error).sum())
+        self.angular_sq_error += float(np.square(angular_error).sum())
+
+        # A command's latency is the delay to the first pose that reflects it. Poses are
+        # sorted, so np.unique's first occurrence of each command index is that pose.
+        match = (active & (np.abs(linear_error) <= VELOCITY_TOLERANCE)
+                 & (np.abs(angular_error) <= VELOCITY_TOLERANCE))
+        matched, first = np.unique(idx[match], return_index=True)
+        latency = (pose_ts[match][first] - commands['timestamp'][matched]) / 1e9
+        pending = np.isnan(commands['latency_s'][matched])
+        commands['latency_s'][matched[pending]] = latency[pending]
+
+    def summary(self, bag: str) -> dict:
+        """Finish the bag and return its summary row and per-command table."""
+        table = np.concatenate(self.commands + [self.carry_cmd])
+        latency = table['latency_s'][~np.isnan(table['latency_s'])]
+        duration = 0.0
+        if self.first_timestamp is not None:
+            duration = (self.last_timestamp - self.first_timestamp) / 1e9
+
+        def rmse(sq_error):
+            return math.sqrt(sq_error / self.pose_count) if self.pose_count else math.nan
+
+        return {
+            'bag': bag,
+            'cmd_count': self.cmd_count,
+            'pose_count': self.pose_count,
+            'duration_s': duration,
+            'path_length': self.path_length if self.pose_count else math.nan,
+            'latency_mean_s': float(latency.mean()) if len(latency) else math.nan,
+            'latency_median_s': float(np.median(latency)) if len(latency) else math.nan,
+            'latency_max_s': float(latency.max()) if len(latency) else math.nan,
+            'unmatched_commands': int(len(table) - len(latency)),
+            'linear_rmse': rmse(self.linear_sq_error),
+            'angular_rmse': rmse(self.angular_sq_error),
+            'error': '',
+            'commands': table,
+        }
+
+
+def analyze_bag(path, cmd_topic: str = CMD_TOPIC, pose_topic: str = POSE_TOPIC,
+                batch_size: int = BATCH_SIZE) -> dict:
+    """
+    Compute the command-to-motion metrics of one bag.
+
+    Args:
+        path: Path to the bag directory.
+        cmd_topic: The ``geometry_msgs/msg/Twist`` command topic.
+        pose_topic: The ``turtlesim/msg/Pose`` topic.
+        batch_size: Number of messages read and decoded at a time.
+
+    Returns:
+        dict: One value per name in ``SUMMARY_FIELDS``, plus ``commands``, a structured
+        array with one row (``COMMAND_FIELDS``) per command. Metrics that need poses are
+        NaN if the bag has none.
+    """
+    metrics = _BagMetrics()
+    with BagReader(path) as bag:
+        cmd_type = bag.topics[cmd_topic].type if cmd_topic in bag.topics else None
+        pose_type = bag.topics[pose_topic].type if pose_topic in bag.topics else None
+
+        for batch in bag.batches([cmd_topic, pose_topic], batch_size=batch_size):
+            topics = np.array([msg.topic for msg in batch])
+            timestamps = np.fromiter((msg.timestamp for msg in batch), np.int64, len(batch))
+            is_cmd = topics == cmd_topic
+            is_pose = ~is_cmd
+
+            cmd = pose = {}
+            if is_cmd.any():
+                cmd = decode_batch(cmd_type, [msg.data for msg, keep in zip(batch, is_cmd)
+                                              if keep])
+            if is_pose.any():
+                pose = decode_batch(pose_type, [msg.data for msg, keep in zip(batch, is_pose)
+                                                if keep])
+            metrics.update(timestamps[is_cmd], cmd, timestamps[is_pose], pose)
+
+    return metrics.summary(str(path))
+
+
+def find_bags(root) -> list:
+    """Return every bag directory (one containing ``metadata.yaml``) under ``root``."""
+    return sorted(path.parent for path in Path(root).rglob(METADATA_FILENAME))
+
+
+def analyze_directory(root, workers: Optional[int] = None, **kwargs) -> list:
+    """
+    Compute the metrics of every bag under a directory in a process pool.
+
+    Args:
+        root: Directory to search for bags.
+        workers: Number of worker processes, defaults to the number of CPUs.
+        **kwargs: Passed on to :func:`analyze_bag`.
+
+    Returns:
+        list: The :func:`analyze_bag` result of each bag, in path order. A bag that could
+        not be analyzed gets a row with only ``bag`` and ``error`` filled in, so one bad
+        bag does not lose the results of the others.
+    """
+    bags = find_bags(root)
+    results = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(analyze_bag, bag, **kwargs) for bag in bags]
+        for bag, future in zip(bags, futures):
+            try:
+                results.append(future.result())
+            except Exception as e:
+                error = f'{type(e).__name__}: {e}'
+                print(f'Failed to analyze {bag}: {error}', file=sys.stderr)
+                results.append({'bag': str(bag), 'error': error,
+                                'commands': np.empty(0, dtype=_COMMAND_DTYPE)})
+    return results
+
+
+def write_summary(results: list, path) -> None:
+    """Write one row per bag to a CSV file."""
+    with open(path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, SUMMARY_FIELDS, extrasaction='ignore')
+        writer.writeheader()
+        writer.writerows(results)
+
+
+def write_commands(result: dict, path) -> None:
+    """Write a bag's per-command latency table to a CSV file."""
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(COMMAND_FIELDS)
+        for row in result['commands']:
+            writer.writerow([row[field] for field in COMMAND_FIELDS])
+
+
+def main(args=None):
+    """Compute cmd_vel/pose alignment and trajectory metrics for a directory of bags."""
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument('root', help='directory containing bag directories')
+    parser.add_argument('-o', '--output', default='bag_metrics.csv',
+                        help='summary CSV to write')
+    parser.add_argument('--commands-dir',
+                        help='also write a per-command latency CSV for each bag here')
+    parser.add_argument('-j', '--workers', type=int, help='number of worker processes')
+    parser.add_argument('--cmd-topic', default=CMD_TOPIC)
+    parser.add_argument('--pose-topic', default=POSE_TOPIC)
+    parsed = parser.parse_args(args)
+
+    results = analyze_directory(parsed.root, parsed.workers, cmd_topic=parsed.cmd_topic,
+                                pose_topic=parsed.pose_topic)
+    write_summary(results, parsed.output)
+    failed = sum(1 for result in results if result['error'])
+    print(f'Wrote metrics for {len(results)} bag(s) to {parsed.output}'
+          + (f', {failed} failed' if failed else ''))
+
+    if parsed.commands_dir:
+        commands_dir = Path(parsed.commands_dir)
+        commands_dir.mkdir(parents=True, exist_ok=True)
+        for result in results:
+            if result['error']:
+                continue
+            write_commands(result, commands_dir / f'{Path(result["bag"]).name}.csv')
+
+
+# Run the script if executed directly (not imported as a module)
+if __name__ == '__main__':
+    main()
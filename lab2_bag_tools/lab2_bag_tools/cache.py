@@ -0,0 +1,336 @@
+"""
+Persistent columnar cache of decoded bags.
+
+The first time a bag is loaded, every fixed-layout topic is decoded with
+:mod:`lab2_bag_tools.cdr` and written to one file per topic. Each column (the timestamps
+and each message field) is stored contiguously in that file, so later loads only have to
+``mmap`` the columns, with no SQLite queries or CDR decoding.
+
+Cache entries are keyed by a SHA-256 over the bag's ``metadata.yaml`` and the contents of
+its ``.db3`` files. When the source bag changes, its key changes, the stale entry is
+removed and a new one is built. Content hashes are remembered per file together with the
+file's size and modification time, so an unchanged multi-GB bag is not re-hashed on
+every load.
+
+Topics whose types have variable-length fields are not cached.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+from pathlib import Path
+import shutil
+import tempfile
+from typing import Optional
+
+from lab2_bag_tools.cdr import fixed_dtype, FIXED_LAYOUTS, iter_topic
+from lab2_bag_tools.reader import BagReader, METADATA_FILENAME
+import numpy as np
+
+# Where caches are kept unless a directory is given explicitly
+DEFAULT_CACHE_DIR = Path(
+    os.environ.get('LAB2_BAG_CACHE', os.path.join('~', '.cache', 'lab2_bag_tools')))
+
+MANIFEST_FILENAME = 'manifest.json'
+
+# Bump when the on-disk layout changes so that old entries are not reused
+CACHE_FORMAT_VERSION = 1
+
+# Columns inside a topic file start on multiples of this many bytes
+COLUMN_ALIGNMENT = 64
+
+# Read size used when hashing storage files
+HASH_CHUNK_SIZE = 1 << 20
+
+
+class TopicTable:
+    """
+    The cached columns of one topic.
+
+    Attributes:
+        name (str): The topic name.
+        type (str): The message type.
+        timestamps (np.ndarray): Receive timestamps in nanoseconds (int64).
+        columns (dict): Maps field names to arrays, one element per message.
+    """
+
+    def __init__(self, name: str, msg_type: str, timestamps: np.ndarray, columns: dict):
+        self.name = name
+        self.type = msg_type
+        self.timestamps = timestamps
+        self.columns = columns
+
+    def __len__(self) -> int:
+        return len(self.timestamps)
+
+    def __getitem__(self, field: str) -> np.ndarray:
+        return self.columns[field]
+
+    def __repr__(self) -> str:
+        return f'TopicTable({self.name!r}, {self.type!r}, {len(self)} messages)'
+
+
+def _topic_filename(topic: str) -> str:
+    """Turn a topic name such as ``/turtle1/pose`` into a file name."""
+    return topic.strip('/').replace('/', '__') + '.columns'
+
+
+def _column_layout(msg_type: str, count: int) -> list:
+    """
+    Lay out the columns of one topic file.
+
+    Returns:
+        list: ``(name, dtype string, offset)`` for the timestamps and every field.
+    """
+    record = fixed_dtype(msg_type)
+    columns = [('timestamp', '<i8')]
+    columns += [(name, record[name].newbyteorder('<').str) for name, _ in
+                FIXED_LAYOUTS[msg_type]]
+    layout = []
+    offset = 0
+    for name, dtype in columns:
+        layout.append((name, dtype, offset))
+        size = count * np.dtype(dtype).itemsize
+        offset += (size + COLUMN_ALIGNMENT - 1) // COLUMN_ALIGNMENT * COLUMN_ALIGNMENT
+    return layout
+
+
+def _open_column(path: Path, dtype: str, offset: int, count: int, mode: str) -> np.ndarray:
+    if count == 0:
+        # np.memmap cannot map an empty region
+        return np.empty(0, dtype)
+    return np.memmap(path, dtype, mode, offset, (count,))
+
+
+class BagCache:
+    """
+    A directory of cached, memory-mappable bag columns.
+
+    Example::
+
+        cache = BagCache()
+        tables = cache.load('lab2/bag_files/subset')
+        pose = tables['/turtle1/pose']
+        pose['x'], pose.timestamps
+
+    Attributes:
+        cache_dir (Path): The cache directory.
+    """
+
+    def __init__(self, cache_dir=None):
+        """
+        Use a cache directory, creating it if needed.
+
+        Args:
+            cache_dir: The cache directory. Defaults to ``$LAB2_BAG_CACHE`` or
+                ``~/.cache/lab2_bag_tools``.
+        """
+        self.cache_dir = Path(cache_dir or DEFAULT_CACHE_DIR).expanduser()
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+    def _file_digest(self, path: Path) -> str:
+        """
+        Return the SHA-256 of a file, reusing the stored digest if the file is unchanged.
+
+        Digests are stored in one small JSON file per source file, so that concurrent
+        processes never contend on a shared index.
+        """
+        path = path.resolve()
+        stat = path.stat()
+        fingerprint = [stat.st_size, stat.st_mtime_ns, stat.st_ino]
+        record_path = (self.cache_dir / 'hashes' /
+                       (hashlib.sha1(str(path).encode()).hexdigest() + '.json'))
+
+        try:
+            with open(record_path) as f:
+                record = json.load(f)
+            if record['fingerprint'] == fingerprint:
+                return record['sha256']
+        except (OSError, ValueError, KeyError):
+            pass
+
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+                digest.update(chunk)
+
+        record_path.parent.mkdir(exist_ok=True)
+        tmp = record_path.with_suffix(f'.{os.getpid()}.tmp')
+        with open(tmp, 'w') as f:
+            json.dump({'path': str(path), 'fingerprint': fingerprint,
+                       'sha256': digest.hexdigest()}, f)
+        os.replace(tmp, record_path)
+        return digest.hexdigest()
+
+    def key(self, bag_path) -> str:
+        """
+        Compute the cache key of a bag from its metadata and storage file contents.
+
+        Args:
+            bag_path: Path to the bag directory.
+
+        Returns:
+            str: A hex digest identifying the bag's current contents.
+        """
+        bag_path = Path(bag_path)
+        digest = hashlib.sha256(f'v{CACHE_FORMAT_VERSION}'.encode())
+        digest.update((bag_path / METADATA_FILENAME).read_bytes())
+        with BagReader(bag_path) as bag:
+            files = bag.files
+        for file in files:
+            digest.update(self._file_digest(file).encode())
+        return digest.hexdigest()
+
+    def load(self, bag_path) -> dict:
+        """
+        Load the cached columns of a bag, building the cache first if needed.
+
+        Args:
+            bag_path: Path to the bag directory.
+
+        Returns:
+            dict: Maps topic names to :class:`TopicTable` objects backed by read-only
+            memory maps.
+        """
+        key = self.key(bag_path)
+        entry = self.cache_dir / key
+        if not (entry / MANIFEST_FILENAME).exists():
+            self.build(bag_path, key)
+
+        with open(entry / MANIFEST_FILENAME) as f:
+            manifest = json.load(f)
+
+        tables = {}
+        for name, topic in manifest['topics'].items():
+            path = entry / topic['file']
+            count = topic['count']
+            columns = {column: _open_column(path, dtype, offset, count, 'r')
+                       for column, dtype, offset in topic['columns']}
+            timestamps = columns.pop('timestamp')
+            tables[name] = TopicTable(name, topic['type'], timestamps, columns)
+        return tables
+
+    def build(self, bag_path, key: Optional[str] = None) -> Path:
+        """
+        Decode a bag into a new cache entry, replacing stale entries for the same bag.
+
+        The entry is written to a temporary directory and renamed into place, so a reader
+        never sees a partially written entry. Topics are decoded in batches and written
+        straight into their files, so memory use does not grow with the bag size.
+
+        Args:
+            bag_path: Path to the bag directory.
+            key: The bag's cache key, if already computed.
+
+        Returns:
+            Path: The cache entry directory.
+        """
+        bag_path = Path(bag_path).resolve()
+        key = key or self.key(bag_path)
+        entry = self.cache_dir / key
+        tmp = Path(tempfile.mkdtemp(prefix=f'.{key}-', dir=self.cache_dir))
+
+        try:
+            manifest = {'version': CACHE_FORMAT_VERSION, 'source': str(bag_path),
+                        'topics': {}}
+            with BagReader(bag_path) as bag:
+                for name, info in bag.topics.items():
+                    if info.type not in FIXED_LAYOUTS:
+                        continue
+                    count = bag.count([name])
+                    layout = _column_layout(info.type, count)
+                    filename = _topic_filename(name)
+                    self._write_topic(bag, name, tmp / filename, layout, count)
+                    manifest['topics'][name] = {'type': info.type, 'file': filename,
+                                                'count': count, 'columns': layout}
+
+            with open(tmp / MANIFEST_FILENAME, 'w') as f:
+                json.dump(manifest, f, indent=2)
+
+            try:
+                os.rename(tmp, entry)
+            except OSError:
+                # Another process built the same entry first
+                if not (entry / MANIFEST_FILENAME).exists():
+                    raise
+                shutil.rmtree(tmp)
+        except BaseException:
+            shutil.rmtree(tmp, ignore_errors=True)
+            raise
+
+        self._remove_stale(bag_path, key)
+        return entry
+
+    def _write_topic(self, bag: BagReader, topic: str, path: Path, layout: list,
+                     count: int) -> None:
+        """Decode one topic batch by batch into a preallocated column file."""
+        if not layout or count == 0:
+            path.touch()
+            return
+        _, last_dtype, last_offset = layout[-1]
+        with open(path, 'wb') as f:
+            f.truncate(last_offset + count * np.dtype(last_dtype).itemsize)
+
+        columns = {name: _open_column(path, dtype, offset, count, 'r+')
+                   for name, dtype, offset in layout}
+        row = 0
+        for timestamps, fields in iter_topic(bag, topic):
+            n = len(timestamps)
+            columns['timestamp'][row:row + n] = timestamps
+            for name, values in fields.items():
+                columns[name][row:row + n] = values
+            row += n
+        for column in columns.values():
+            column.flush()
+
+    def _remove_stale(self, bag_path: Path, key: str) -> None:
+        """Delete cache entries built from older contents of the same bag."""
+        for manifest_path in self.cache_dir.glob(f'*/{MANIFEST_FILENAME}'):
+            entry = manifest_path.parent
+            if entry.name == key:
+                continue
+            try:
+                with open(manifest_path) as f:
+                    source = json.load(f).get('source')
+            except (OSError, ValueError):
+                continue
+            if source == str(bag_path):
+                shutil.rmtree(entry, ignore_errors=True)
+
+    def clear(self) -> None:
+        """Delete every entry in the cache."""
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+
+def load_bag(bag_path, cache_dir=None) -> dict:
+    """
+    Load a bag's columns through the cache.
+
+    Args:
+        bag_path: Path to the bag directory.
+        cache_dir: The cache directory, see :class:`BagCache`.
+
+    Returns:
+        dict: Maps topic names to :class:`TopicTable` objects.
+    """
+    return BagCache(cache_dir).load(bag_path)
+
+
+def main(args=None):
+    """Build (or refresh) the columnar cache for one or more bags."""
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument('bags', nargs='+', help='paths to bag directories')
+    parser.add_argument('--cache-dir', help='cache directory')
+    parsed = parser.parse_args(args)
+
+    cache = BagCache(parsed.cache_dir)
+    for bag in parsed.bags:
+        for name, table in cache.load(bag).items():
+            print(f'{bag}: {name} | {table.type} | {len(table)} messages')
+
+
+# Run the script if executed directly (not imported as a module)
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,414 @@
+"""
+Native rosbag2 reader.
+
+Reads rosbag2 recordings (such as the ones in ``lab2/bag_files``) without the ROS 2
+toolchain. The bag's ``metadata.yaml`` is parsed with PyYAML and the ``.db3`` files are
+queried directly with :mod:`sqlite3`. Topic and time-range filters are pushed down into the
+SQL query so that the ``timestamp_idx`` index written by rosbag2 can be used, and rows are
+fetched lazily in batches, so reading a short window of a large bag never scans the
+whole file.
+
+All timestamps are integer nanoseconds since the epoch, exactly as stored by rosbag2.
+"""
+
+import argparse
+import heapq
+from pathlib import Path
+import sqlite3
+from typing import Iterable, Iterator, NamedTuple, Optional
+
+import yaml
+
+METADATA_FILENAME = 'metadata.yaml'
+
+# Number of rows pulled from SQLite per fetchmany() call
+DEFAULT_BATCH_SIZE = 1024
+
+
+class BagMessage(NamedTuple):
+    """A single serialized message read from a bag."""
+
+    topic: str
+    timestamp: int
+    data: bytes
+
+
+class TopicInfo:
+    """
+    Metadata about one topic recorded in a bag.
+
+    Attributes:
+        name (str): The topic name, e.g. ``/turtle1/pose``.
+        type (str): The message type, e.g. ``turtlesim/msg/Pose``.
+        serialization_format (str): The serialization format, normally ``cdr``.
+        offered_qos_profiles (str): The QoS profiles as a YAML string.
+        message_count (int): Number of messages recorded on the topic.
+    """
+
+    def __init__(self, name: str, msg_type: str, serialization_format: str = 'cdr',
+                 offered_qos_profiles: str = '', message_count: int = 0):
+        self.name = name
+        self.type = msg_type
+        self.serialization_format = serialization_format
+        self.offered_qos_profiles = offered_qos_profiles
+        self.message_count = message_count
+
+    def __repr__(self) -> str:
+        return f'TopicInfo({self.name!r}, {self.type!r}, message_count={self.message_count})'
+
+
+class BagMetadata:
+    """
+    Contents of a rosbag2 ``metadata.yaml`` file.
+
+    Attributes:
+        version (int): The metadata format version.
+        storage_identifier (str): The storage plugin, only ``sqlite3`` is supported.
+        starting_time (int): Timestamp of the first message in nanoseconds.
+        duration (int): Time between the first and last message in nanoseconds.
+        message_count (int): Total number of messages in the bag.
+        topics (dict): Maps topic names to :class:`TopicInfo`.
+        relative_file_paths (list): The storage files, relative to the bag directory.
+        compression_format (str): The compression format, empty if uncompressed.
+        compression_mode (str): The compression mode, empty if uncompressed.
+        files (list): Per-file ``path``, ``starting_time``, ``duration`` and
+            ``message_count`` dicts, times in nanoseconds.
+    """
+
+    def __init__(self, version: int, storage_identifier: str, starting_time: int,
+                 duration: int, message_count: int, topics: dict,
+                 relative_file_paths: list, compression_format: str = '',
+                 compression_mode: str = '', files: Optional[list] = None):
+        self.version = version
+        self.storage_identifier = storage_identifier
+        self.starting_time = starting_time
+        self.duration = duration
+        self.message_count = message_count
+        self.topics = topics
+        self.relative_file_paths = relative_file_paths
+        self.compression_format = compression_format
+        self.compression_mode = compression_mode
+        self.files = files or []
+
+    @property
+    def end_time(self) -> int:
+        """Timestamp of the last message in nanoseconds."""
+        return self.starting_time + self.duration
+
+    @classmethod
+    def from_file(cls, path) -> 'BagMetadata':
+        """
+        Parse a ``metadata.yaml`` file.
+
+        Args:
+            path: Path to the ``metadata.yaml`` file.
+
+        Returns:
+            BagMetadata: The parsed metadata.
+        """
+        with open(path) as f:
+            info = yaml.safe_load(f)['rosbag2_bagfile_information']
+
+        topics = {}
+        for entry in info.get('topics_with_message_count', []):
+            topic = entry['topic_metadata']
+            topics[topic['name']] = TopicInfo(
+                topic['name'], topic['type'], topic.get('serialization_format', 'cdr'),
+                topic.get('offered_qos_profiles', ''), entry.get('message_count', 0))
+
+        return cls(
+            version=info['version'],
+            storage_identifier=info['storage_identifier'],
+            starting_time=info['starting_time']['nanoseconds_since_epoch'],
+            duration=info['duration']['nanoseconds'],
+            message_count=info['message_count'],
+            topics=topics,
+            relative_file_paths=list(info['relative_file_paths']),
+            compression_format=info.get('compression_format', ''),
+            compression_mode=info.get('compression_mode', ''),
+            files=[{'path': entry['path'],
+                    'starting_time': entry['starting_time']['nanoseconds_since_epoch'],
+                    'duration': entry['duration']['nanoseconds'],
+                    'message_count': entry['message_count']}
+                   for entry in info.get('files', [])],
+        )
+
+    def to_file(self, path) -> None:
+        """
+        Write the metadata as a rosbag2 ``metadata.yaml`` file.
+
+        Args:
+            path: Path to the ``metadata.yaml`` file to write.
+        """
+        info = {
+            'version': self.version,
+            'storage_identifier': self.storage_identifier,
+            'duration': {'nanoseconds': self.duration},
+            'starting_time': {'nanoseconds_since_epoch': self.starting_time},
+            'message_count': self.message_count,
+            'topics_with_message_count': [
+                {'topic_metadata': {'name': topic.name,
+                                    'type': topic.type,
+                                    'serialization_format': topic.serialization_format,
+                                    'offered_qos_profiles': topic.offered_qos_profiles},
+                 'message_count': topic.message_count}
+                for topic in self.topics.values()],
+            'compression_format': self.compression_format,
+            'compression_mode': self.compression_mode,
+            'relative_file_paths': list(self.relative_file_paths),
+            'files': [{'path': entry['path'],
+                       'starting_time': {'nanoseconds_since_epoch': entry['starting_time']},
+                       'duration': {'nanoseconds': entry['duration']},
+                       'message_count': entry['message_count']}
+                      for entry in self.files],
+        }
+        with open(path, 'w') as f:
+            yaml.safe_dump({'rosbag2_bagfile_information': info}, f, sort_keys=False,
+                           width=float('inf'))
+
+
+class BagReader:
+    """
+    Reads serialized messages from a rosbag2 sqlite3 bag.
+
+    The reader can be used as a context manager, which closes the underlying database
+    connections on exit::
+
+        with BagReader('lab2/bag_files/subset') as bag:
+            for msg in bag.messages(topics=['/turtle1/pose']):
+                ...
+
+    Attributes:
+        path (Path): The bag directory.
+        metadata (BagMetadata): The parsed ``metadata.yaml``.
+    """
+
+    def __init__(self, path):
+        """
+        Open a bag directory and parse its metadata.
+
+        Args:
+            path: Path to the bag directory containing ``metadata.yaml``.
+
+        Raises:
+            ValueError: If the bag uses a storage plugin or compression that is not supported.
+        """
+        self.path = Path(path)
+        self.metadata = BagMetadata.from_file(self.path / METADATA_FILENAME)
+
+        if self.metadata.storage_identifier != 'sqlite3':
+            raise ValueError(
+                f'Unsupported storage identifier {self.metadata.storage_identifier!r}')
+        if self.metadata.compression_mode:
+            raise ValueError(f'Compressed bags are not supported ({self.path})')
+
+        # Connections are opened lazily, one per storage file
+        self._connections: dict = {}
+
+    @property
+    def topics(self) -> dict:
+        """Map of topic names to :class:`TopicInfo`."""
+        return self.metadata.topics
+
+    @property
+    def files(self) -> list:
+        """Absolute paths to the bag's ``.db3`` storage files."""
+        return [self.path / name for name in self.metadata.relative_file_paths]
+
+    @property
+    def ros_distro(self) -> Optional[str]:
+        """The ROS distribution recorded in the first storage file, if any."""
+        if not self.files:
+            return None
+        try:
+            row = self._connect(self.files[0]).execute(
+                'SELECT ros_distro FROM schema').fetchone()
+        except sqlite3.OperationalError:
+            # Bags recorded before Humble have no schema table
+            return None
+        return row[0] if row else None
+
+    def _connect(self, file: Path) -> sqlite3.Connection:
+        """Return a read-only connection to one storage file, opening it if needed."""
+        conn = self._connections.get(file)
+        if conn is None:
+            conn = sqlite3.connect(file.resolve().as_uri() + '?mode=ro', uri=True)
+            self._connections[file] = conn
+        return conn
+
+    def _build_query(self, conn: sqlite3.Connection, select: str,
+                     topics: Optional[Iterable[str]], start: Optional[int],
+                     end: Optional[int]) -> Optional[tuple]:
+        """
+        Build a filtered query over the messages table of one storage file.
+
+        Args:
+            conn: Connection to the storage file.
+            select: The columns to select.
+            topics: Topic names to keep, or None for all topics.
+            start: Inclusive lower bound on the timestamp, or None.
+            end: Exclusive upper bound on the timestamp, or None.
+
+        Returns:
+            A ``(sql, params)`` tuple, or None if none of the topics exist in this file.
+        """
+        sql = (f'SELECT {select} FROM messages '
+               'JOIN topics ON messages.topic_id = topics.id')
+        clauses = []
+        params: list = []
+
+        if topics is not None:
+            # Topic ids are assigned per file, so resolve them here instead of joining
+            # on the name. This keeps the filter on the messages table itself.
+            wanted = set(topics)
+            ids = [topic_id for topic_id, name in conn.execute('SELECT id, name FROM topics')
+                   if name in wanted]
+            if not ids:
+                return None
+            clauses.append(f'messages.topic_id IN ({",".join("?" * len(ids))})')
+            params.extend(ids)
+        if start is not None:
+            clauses.append('messages.timestamp >= ?')
+            params.append(start)
+        if end is not None:
+            clauses.append('messages.timestamp < ?')
+            params.append(end)
+
+        if clauses:
+            sql += ' WHERE ' + ' AND '.join(clauses)
+        return sql, params
+
+    def _iter_file(self, file: Path, topics, start, end, batch_size) -> Iterator[BagMessage]:
+        """Yield the matching messages of one storage file in timestamp order."""
+        conn = self._connect(file)
+        query = self._build_query(
+            conn, 'topics.name, messages.timestamp, messages.data', topics, start, end)
+        if query is None:
+            return
+        sql, params = query
+        cursor = conn.execute(sql + ' ORDER BY messages.timestamp, messages.id', params)
+        try:
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                for row in rows:
+                    yield BagMessage._make(row)
+        finally:
+            cursor.close()
+
+    def messages(self, topics: Optional[Iterable[str]] = None, start: Optional[int] = None,
+                 end: Optional[int] = None,
+                 batch_size: int = DEFAULT_BATCH_SIZE) -> Iterator[BagMessage]:
+        """
+        Lazily iterate over the serialized messages in the bag.
+
+        Messages are yielded in timestamp order. The filters are evaluated by SQLite, and
+        only ``batch_size`` rows per storage file are held in memory at a time.
+
+        Args:
+            topics: Topic names to read, or None to read every topic.
+            start: Inclusive start of the time range in nanoseconds since the epoch.
+            end: Exclusive end of the time range in nanoseconds since the epoch.
+            batch_size: Number of rows fetched from SQLite at once.
+
+        Yields:
+            BagMessage: The topic name, timestamp and serialized data of each message.
+        """
+        if topics is not None:
+            topics = list(topics)
+        streams = [self._iter_file(file, topics, start, end, batch_size)
+                   for file in self.files]
+        if len(streams) == 1:
+            yield from streams[0]
+        else:
+            yield from heapq.merge(*streams, key=lambda msg: msg.timestamp)
+
+    def batches(self, topics: Optional[Iterable[str]] = None, start: Optional[int] = None,
+                end: Optional[int] = None,
+                batch_size: int = DEFAULT_BATCH_SIZE) -> Iterator[list]:
+        """
+        Iterate over the messages in the bag in lists of at most ``batch_size``.
+
+        Takes the same arguments as :meth:`messages`.
+
+        Yields:
+            list: Consecutive :class:`BagMessage` objects in timestamp order.
+        """
+        batch = []
+        for msg in self.messages(topics, start, end, batch_size):
+            batch.append(msg)
+            if len(batch) == batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def count(self, topics: Optional[Iterable[str]] = None, start: Optional[int] = None,
+              end: Optional[int] = None) -> int:
+        """
+        Count the messages matching the given filters without reading their data.
+
+        Takes the same filter arguments as :meth:`messages`.
+
+        Returns:
+            int: The number of matching messages.
+        """
+        if topics is not None:
+            topics = list(topics)
+        total = 0
+        for file in self.files:
+            conn = self._connect(file)
+            query = self._build_query(conn, 'COUNT(*)', topics, start, end)
+            if query is not None:
+                total += conn.execute(*query).fetchone()[0]
+        return total
+
+    def close(self) -> None:
+        """Close all open database connections."""
+        for conn in self._connections.values():
+            conn.close()
+        self._connections.clear()
+
+    def __enter__(self) -> 'BagReader':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+def main(args=None):
+    """
+    Print a summary of a bag, optionally restricted to a topic subset and time window.
+
+    The window is given in seconds relative to the start of the bag.
+    """
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument('bag', help='path to the bag directory')
+    parser.add_argument('-t', '--topics', nargs='+', help='topics to include')
+    parser.add_argument('--start', type=float, help='window start in seconds from bag start')
+    parser.add_argument('--end', type=float, help='window end in seconds from bag start')
+    parsed = parser.parse_args(args)
+
+    with BagReader(parsed.bag) as bag:
+        meta = bag.metadata
+        start = end = None
+        if parsed.start is not None:
+            start = meta.starting_time + int(parsed.start * 1e9)
+        if parsed.end is not None:
+            end = meta.starting_time + int(parsed.end * 1e9)
+
+        print(f'Files:      {", ".join(meta.relative_file_paths)}')
+        print(f'Duration:   {meta.duration / 1e9:.3f}s')
+        print(f'Start:      {meta.starting_time}')
+        print(f'Messages:   {meta.message_count}')
+        for name, topic in bag.topics.items():
+            if parsed.topics and name not in parsed.topics:
+                continue
+            print(f'Topic: {name} | Type: {topic.type} | '
+                  f'Count: {bag.count([name], start, end)}')
+
+
+# Run the script if executed directly (not imported as a module)
+if __name__ == '__main__':
+    main()
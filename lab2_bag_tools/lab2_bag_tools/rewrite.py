@@ -0,0 +1,332 @@
+r"""
+Streaming rosbag2 rewriting: subsetting, merging and splitting bags.
+
+Serialized messages are copied straight from the input ``.db3`` files into new ones. They
+are never deserialized. Rows are read lazily with :class:`BagReader` and inserted in
+batches, one transaction per batch, so memory use depends on the batch size and not on
+the size of the bags. The output's ``metadata.yaml`` is regenerated from the messages that
+were actually written.
+
+Example, cutting seconds 2 to 5 of the pose topic out of a recording::
+
+    ros2 run lab2_bag_tools bag_rewrite lab2/bag_files/subset -o pose_window \
+        --topics /turtle1/pose --start 2 --end 5
+"""
+
+import argparse
+import heapq
+from pathlib import Path
+import shutil
+import sqlite3
+from typing import Iterable, Optional
+
+from lab2_bag_tools.reader import (BagMetadata, BagReader, DEFAULT_BATCH_SIZE,
+                                   METADATA_FILENAME, TopicInfo)
+
+# Schema of the rosbag2 sqlite3 storage plugin (schema version 3, as written by Humble)
+SCHEMA_VERSION = 3
+SCHEMA = """
+CREATE TABLE schema(schema_version INTEGER PRIMARY KEY,ros_distro TEXT NOT NULL);
+CREATE TABLE metadata(id INTEGER PRIMARY KEY,metadata_version INTEGER NOT NULL,metadata TEXT NOT NULL);
+CREATE TABLE topics(id INTEGER PRIMARY KEY,name TEXT NOT NULL,type TEXT NOT NULL,serialization_format TEXT NOT NULL,offered_qos_profiles TEXT NOT NULL);
+CREATE TABLE messages(id INTEGER PRIMARY KEY,topic_id INTEGER NOT NULL,timestamp INTEGER NOT NULL, data BLOB NOT NULL);
+CREATE INDEX timestamp_idx ON messages (timestamp ASC);
+"""  # noqa: E501
+
+# Version of the metadata.yaml format that is written
+METADATA_VERSION = 5
+
+
+class BagWriter:
+    """
+    Writes serialized messages to a new rosbag2 sqlite3 bag.
+
+    The output can be split into several storage files by duration or size, the same way
+    ``ros2 bag record --max-bag-duration/--max-bag-size`` does. ``metadata.yaml`` is
+    written when the writer is closed, which also happens when it is used as a context
+    manager. If the ``with`` block raises, the partial bag is removed instead.
+
+    Attributes:
+        path (Path): The bag directory being written.
+        topics (dict): Maps topic names to :class:`TopicInfo`, with running message counts.
+    """
+
+    def __init__(self, path, ros_distro: str = 'humble',
+                 max_file_duration: Optional[int] = None, max_file_size: Optional[int] = None,
+                 batch_size: int = DEFAULT_BATCH_SIZE):
+        """
+        Create the bag directory and its first storage file.
+
+        Args:
+            path: The bag directory to create. It must not exist yet.
+            ros_distro: ROS distribution recorded in the storage files' schema table.
+            max_file_duration: Start a new storage file once the current one spans this many
+                nanoseconds, or None to never split by duration.
+            max_file_size: Start a new storage file once this many bytes of message data have
+                been written to the current one, or None to never split by size.
+            batch_size: Number of messages inserted per transaction.
+
+        Raises:
+            FileExistsError: If ``path`` already exists.
+        """
+        self.path = Path(path)
+        self.path.mkdir(parents=True)
+        self.ros_distro = ros_distro
+        self.max_file_duration = max_file_duration
+        self.max_file_size = max_file_size
+        self.batch_size = batch_size
+        self.topics: dict = {}
+
+        self._files: list = []
+        self._conn: Optional[sqlite3.Connection] = None
+        self._topic_ids: dict = {}
+        self._pending: list = []
+        self._open_file()
+
+    def _open_file(self) -> None:
+        """Finish the current storage file, if any, and start the next one."""
+        self._close_file()
+        name = f'{self.path.name}_{len(self._files)}.db3'
+        self._conn = sqlite3.connect(self.path / name)
+        self._conn.execute('PRAGMA journal_mode=MEMORY')
+        self._conn.execute('PRAGMA synchronous=OFF')
+        self._conn.executescript(SCHEMA)
+        with self._conn:
+            self._conn.execute('INSERT INTO schema VALUES (?, ?)',
+                               (SCHEMA_VERSION, self.ros_distro))
+        self._topic_ids = {}
+        self._files.append({'path': name, 'starting_time': None, 'end_time': None,
+                            'message_count': 0, 'size': 0})
+        for topic in self.topics.values():
+            self._register(topic)
+
+    def _register(self, topic: TopicInfo) -> None:
+        """Add a topic to the current storage file."""
+        with self._conn:
+            cursor = self._conn.execute(
+                'INSERT INTO topics (name, type, serialization_format, offered_qos_profiles) '
+                'VALUES (?, ?, ?, ?)',
+                (topic.name, topic.type, topic.serialization_format,
+                 topic.offered_qos_profiles))
+        self._topic_ids[topic.name] = cursor.lastrowid
+
+    def add_topic(self, topic: TopicInfo) -> None:
+        """
+        Declare a topic before writing messages to it.
+
+        Adding a topic that already exists with the same type does nothing.
+
+        Args:
+            topic: The topic's metadata. Its message count is ignored.
+
+        Raises:
+            ValueError: If the topic already exists with a different type.
+        """
+        existing = self.topics.get(topic.name)
+        if existing is not None:
+            if existing.type != topic.type:
+                raise ValueError(f'Topic {topic.name} has conflicting types '
+                                 f'{existing.type} and {topic.type}')
+            return
+        self.topics[topic.name] = TopicInfo(topic.name, topic.type,
+                                            topic.serialization_format,
+                                            topic.offered_qos_profiles)
+        self._register(topic)
+
+    def _should_split(self, timestamp: int) -> bool:
+        current = self._files[-1]
+        if current['message_count'] == 0:
+            return False
+        if (self.max_file_duration is not None
+                and timestamp - current['starting_time'] >= self.max_file_duration):
+            return True
+        return self.max_file_size is not None and current['size'] >= self.max_file_size
+
+    def write(self, topic: str, timestamp: int, data: bytes) -> None:
+        """
+        Write one serialized message.
+
+        Args:
+            topic: The topic name, which must have been added with :meth:`add_topic`.
+            timestamp: The receive timestamp in nanoseconds since the epoch.
+            data: The serialized message.
+        """
+        if self._should_split(timestamp):
+            self._flush()
+            self._open_file()
+
+        current = self._files[-1]
+        if current['starting_time'] is None or timestamp < current['starting_time']:
+            current['starting_time'] = timestamp
+        if current['end_time'] is None or timestamp > current['end_time']:
+            current['end_time'] = timestamp
+        current['message_count'] += 1
+        current['size'] += len(data)
+        self.topics[topic].message_count += 1
+
+        self._pending.append((self._topic_ids[topic], timestamp, data))
+        if len(self._pending) >= self.batch_size:
+            self._flush()
+
+    def _flush(self) -> None:
+        """Insert the pending messages in a single transaction."""
+        if not self._pending:
+            return
+        with self._conn:
+            self._conn.executemany(
+                'INSERT INTO messages (topic_id, timestamp, data) VALUES (?, ?, ?)',
+                self._pending)
+        self._pending = []
+
+    def _close_file(self) -> None:
+        if self._conn is not None:
+            self._flush()
+            self._conn.close()
+            self._conn = None
+
+    def close(self) -> None:
+        """Flush the remaining messages and write ``metadata.yaml``."""
+        if self._conn is None:
+            return
+        self._close_file()
+
+        files = []
+        for entry in self._files:
+            start = entry['starting_time'] or 0
+            files.append({'path': entry['path'], 'starting_time': start,
+                          'duration': (entry['end_time'] or 0) - start,
+                          'message_count': entry['message_count']})
+
+        written = [entry for entry in self._files if entry['message_count']]
+        start = min((entry['starting_time'] for entry in written), default=0)
+        end = max((entry['end_time'] for entry in written), default=0)
+        metadata = BagMetadata(
+            version=METADATA_VERSION,
+            storage_identifier='sqlite3',
+            starting_time=start,
+            duration=end - start,
+            message_count=sum(entry['message_count'] for entry in files),
+            topics=self.topics,
+            relative_file_paths=[entry['path'] for entry in files],
+            files=files,
+        )
+        metadata.to_file(self.path / METADATA_FILENAME)
+
+    def abort(self) -> None:
+        """Discard the bag: close the storage files and remove the bag directory."""
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+        self._pending = []
+        shutil.rmtree(self.path, ignore_errors=True)
+
+    def __enter__(self) -> 'BagWriter':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        if exc_info[0] is not None:
+            self.abort()
+        else:
+            self.close()
+
+
+def rewrite(inputs: Iterable, output, topics: Optional[Iterable[str]] = None,
+            start: Optional[int] = None, end: Optional[int] = None,
+            max_file_duration: Optional[int] = None, max_file_size: Optional[int] = None,
+            batch_size: int = DEFAULT_BATCH_SIZE) -> BagMetadata:
+    """
+    Copy messages from one or more bags into a new bag.
+
+    With a single input this subsets (and optionally splits) it; with several inputs their
+    messages are merged in timestamp order.
+
+    Args:
+        inputs: Paths to the input bag directories.
+        output: The output bag directory. It must not exist yet.
+        topics: Topic names to keep, or None to keep every topic.
+        start: Inclusive start of the time range in nanoseconds since the epoch, or None.
+        end: Exclusive end of the time range in nanoseconds since the epoch, or None.
+        max_file_duration: See :class:`BagWriter`.
+        max_file_size: See :class:`BagWriter`.
+        batch_size: Number of messages read and inserted at a time.
+
+    Returns:
+        BagMetadata: The metadata written for the output bag.
+
+    Raises:
+        ValueError: If the same topic has different types in different inputs.
+    """
+    readers = [BagReader(path) for path in inputs]
+    try:
+        if topics is not None:
+            topics = list(topics)
+        ros_distro = (readers[0].ros_distro if readers else None) or 'humble'
+
+        # Check every input for conflicting topic types before creating the output, so a
+        # failed merge leaves nothing behind.
+        selected: dict = {}
+        for reader in readers:
+            for name, topic in reader.topics.items():
+                if topics is not None and name not in topics:
+                    continue
+                existing = selected.setdefault(name, topic)
+                if existing.type != topic.type:
+                    raise ValueError(f'Topic {name} has conflicting types '
+                                     f'{existing.type} and {topic.type}')
+
+        with BagWriter(output, ros_distro, max_file_duration, max_file_size,
+                       batch_size) as writer:
+            # Topics are declared even if none of their messages fall in the time range,
+            # and then show up with a count of zero, as they would in rosbag2.
+            for topic in selected.values():
+                writer.add_topic(topic)
+
+            streams = [reader.messages(topics, start, end, batch_size) for reader in readers]
+            for msg in heapq.merge(*streams, key=lambda msg: msg.timestamp):
+                writer.write(*msg)
+
+        return BagMetadata.from_file(Path(output) / METADATA_FILENAME)
+    finally:
+        for reader in readers:
+            reader.close()
+
+
+def main(args=None):
+    """
+    Subset, merge or split bags without deserializing their messages.
+
+    The time window is given in seconds relative to the start of the earliest input bag.
+    """
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument('inputs', nargs='+', help='input bag directories')
+    parser.add_argument('-o', '--output', required=True, help='output bag directory')
+    parser.add_argument('-t', '--topics', nargs='+', help='topics to keep')
+    parser.add_argument('--start', type=float, help='window start in seconds')
+    parser.add_argument('--end', type=float, help='window end in seconds')
+    parser.add_argument('--max-bag-duration', type=float,
+                        help='split the output into files of at most this many seconds')
+    parser.add_argument('--max-bag-size', type=int,
+                        help='split the output into files of about this many bytes')
+    parsed = parser.parse_args(args)
+
+    bag_start = min(BagMetadata.from_file(Path(path) / METADATA_FILENAME).starting_time
+                    for path in parsed.inputs)
+    start = end = max_duration = None
+    if parsed.start is not None:
+        start = bag_start + int(parsed.start * 1e9)
+    if parsed.end is not None:
+        end = bag_start + int(parsed.end * 1e9)
+    if parsed.max_bag_duration is not None:
+        max_duration = int(parsed.max_bag_duration * 1e9)
+
+    metadata = rewrite(parsed.inputs, parsed.output, parsed.topics, start, end,
+                       max_duration, parsed.max_bag_size)
+    print(f'Wrote {metadata.message_count} messages to {parsed.output} '
+          f'({len(metadata.relative_file_paths)} file(s), {metadata.duration / 1e9:.3f}s)')
+    for name, topic in metadata.topics.items():
+        print(f'Topic: {name} | Type: {topic.type} | Count: {topic.message_count}')
+
+
+# Run the script if executed directly (not imported as a module)
+if __name__ == '__main__':
+    main()
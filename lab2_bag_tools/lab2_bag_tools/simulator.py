@@ -0,0 +1,277 @@
+"""
+Offline closed-loop simulation of gamepad teleop against recorded turtlesim poses.
+
+A small kinematic model of turtlesim integrates ``Twist`` commands into ``Pose`` at a fixed
+step, following ``turtlesim::Turtle::update``: the heading is advanced first, then the
+position along the new heading, the turtle is stopped when no command has arrived for
+one second, and it is clamped to the walls of the window.
+
+Recorded ``cmd_vel`` messages are treated as the output of ``Gamepad.joy_callback``. The
+stick positions are recovered by dividing each command by the scale factors it was recorded
+with (``reference_scale``), and are then run through
+:func:`lab4_gamepad.mapping.axes_to_velocity`, the same function the Gamepad node uses,
+with the candidate scale factors. A change to that mapping therefore shows up in the
+simulated trajectories. All candidates are integrated together as arrays, one element per
+candidate, so sweeping thousands of them costs little more than one.
+"""
+
+import argparse
+import math
+from typing import Iterator
+
+from lab2_bag_tools.analytics import CMD_TOPIC, COMMAND_TIMEOUT, merge_asof, POSE_TOPIC
+from lab2_bag_tools.cdr import read_topic
+from lab2_bag_tools.reader import BagReader
+from lab4_gamepad.mapping import (ANGULAR_AXIS, ANGULAR_SCALE, axes_to_velocity,
+                                  LINEAR_AXIS, LINEAR_SCALE)
+import numpy as np
+
+# turtlesim updates (and publishes the pose) every 16 ms
+UPDATE_PERIOD = 16_000_000
+
+# turtlesim clamps the turtle to [0, (width - 1) / scale]: its window is 500 pixels wide
+# and 45 pixels make one pose unit, so the far wall is at about 11.0889
+WALL = (500 - 1) / 45
+
+
+def _recover_axes(cmd_linear: np.ndarray, cmd_angular: np.ndarray,
+                  reference_scale: tuple) -> np.ndarray:
+    """
+    Recover the stick positions behind recorded commands.
+
+    Returns:
+        np.ndarray: Axis values shaped ``(n_axes, n_commands)``, indexed like ``Joy.axes``.
+
+    Raises:
+        ValueError: If a recovered stick position is outside [-1, 1], which means the
+            commands were not recorded with ``reference_scale`` (for example, they came
+            from turtle_teleop_key rather than the gamepad).
+    """
+    cmd_linear = np.asarray(cmd_linear, dtype=np.float64)
+    axes = np.zeros((max(LINEAR_AXIS, ANGULAR_AXIS) + 1, len(cmd_linear)))
+    axes[LINEAR_AXIS] = cmd_linear / reference_scale[0]
+    axes[ANGULAR_AXIS] = np.asarray(cmd_angular, dtype=np.float64) / reference_scale[1]
+
+    largest = float(np.abs(axes).max()) if axes.size else 0.0
+    if largest > 1.0 + 1e-6:
+        raise ValueError(f'Recorded commands imply a stick position of {largest:.3g} with '
+                         f'reference scale factors {tuple(reference_scale)}; pass the '
+                         'scale factors the commands were actually recorded with')
+    return axes
+
+
+def _integrate(cmd_ts: np.ndarray, cmd_axes: np.ndarray, initial_pose: tuple,
+               sample_ts: np.ndarray, step: int, linear_scale: np.ndarray,
+               angular_scale: np.ndarray) -> Iterator[tuple]:
+    """
+    Integrate the commands for every candidate and yield the poses at the sample times.
+
+    Yields:
+        tuple: ``(x, y, theta)`` arrays with one element per candidate, for each sample.
+    """
+    sample_ts = np.asarray(sample_ts, dtype=np.int64)
+    if len(sample_ts) == 0:
+        return
+    n_steps = int(math.ceil((sample_ts[-1] - sample_ts[0]) / step))
+    step_ts = sample_ts[0] + step * np.arange(1, n_steps + 1, dtype=np.int64)
+
+    # The command in force at each step is the same for every candidate, so look it up
+    # once. Steps more than COMMAND_TIMEOUT after the last command leave the turtle still.
+    idx = merge_asof(step_ts, np.asarray(cmd_ts, dtype=np.int64), COMMAND_TIMEOUT)
+
+    # Number of updates turtlesim has completed when each sample is published
+    sample_steps = np.searchsorted(step_ts, sample_ts, side='right')
+
+    dt = step / 1e9
+    shape = np.broadcast(linear_scale, angular_scale).shape
+    x = np.full(shape, float(initial_pose[0]))
+    y = np.full(shape, float(initial_pose[1]))
+    theta = np.full(shape, float(initial_pose[2]))
+
+    k = 0
+    previous = None
+    for n in sample_steps:
+        while k < n:
+            if idx[k] < 0:
+                linear = angular = 0.0
+            elif idx[k] != previous:
+                # The gamepad mapping turns the stick positions into velocities for
+                # every candidate at once
+                linear, angular = axes_to_velocity(cmd_axes[:, idx[k]], linear_scale,
+                                                   angular_scale)
+            previous = idx[k]
+            theta += angular * dt
+            theta = np.arctan2(np.sin(theta), np.cos(theta))
+            distance = linear * dt
+            x += np.cos(theta) * distance
+            y += np.sin(theta) * distance
+            np.clip(x, 0.0, WALL, out=x)
+            np.clip(y, 0.0, WALL, out=y)
+            k += 1
+        yield x, y, theta
+
+
+def _candidates(linear_scale, angular_scale) -> tuple:
+    return np.broadcast_arrays(np.asarray(linear_scale, dtype=np.float64),
+                               np.asarray(angular_scale, dtype=np.float64))
+
+
+def simulate(cmd_ts: np.ndarray, cmd_linear: np.ndarray, cmd_angular: np.ndarray,
+             initial_pose: tuple, sample_ts: np.ndarray, step: int = UPDATE_PERIOD,
+             linear_scale=LINEAR_SCALE, angular_scale=ANGULAR_SCALE,
+             reference_scale: tuple = (LINEAR_SCALE, ANGULAR_SCALE)) -> dict:
+    """
+    Simulate the turtle's trajectory for one or more sets of gamepad scale factors.
+
+    Args:
+        cmd_ts: Command timestamps in nanoseconds, sorted.
+        cmd_linear: Recorded ``linear.x`` of each command.
+        cmd_angular: Recorded ``angular.z`` of each command.
+        initial_pose: ``(x, y, theta)`` of the turtle at ``sample_ts[0]``.
+        sample_ts: Times at which to report the pose, in nanoseconds, sorted.
+        step: Integration step in nanoseconds.
+        linear_scale: Candidate linear scale factor(s), scalar or array.
+        angular_scale: Candidate angular scale factor(s), broadcast against linear_scale.
+        reference_scale: The ``(linear, angular)`` scale factors the commands were
+            recorded with.
+
+    Returns:
+        dict: ``x``, ``y`` and ``theta`` arrays of shape ``(len(sample_ts),) + candidates``.
+
+    Raises:
+        ValueError: If the commands do not fit ``reference_scale``.
+    """
+    linear_scale, angular_scale = _candidates(linear_scale, angular_scale)
+    cmd_axes = _recover_axes(cmd_linear, cmd_angular, reference_scale)
+    poses = [tuple(value.copy() for value in pose) for pose in _integrate(
+        cmd_ts, cmd_axes, initial_pose, sample_ts, step, linear_scale, angular_scale)]
+    shape = (len(poses),) + linear_scale.shape
+    return {name: np.array([pose[i] for pose in poses]).reshape(shape)
+            for i, name in enumerate(('x', 'y', 'theta'))}
+
+
+def trajectory_error(cmd_ts: np.ndarray, cmd_linear: np.ndarray, cmd_angular: np.ndarray,
+                     pose_ts: np.ndarray, pose: dict, step: int = UPDATE_PERIOD,
+                     linear_scale=LINEAR_SCALE, angular_scale=ANGULAR_SCALE,
+                     reference_scale: tuple = (LINEAR_SCALE, ANGULAR_SCALE)) -> dict:
+    """
+    Compare simulated trajectories against recorded poses.
+
+    The simulation starts from the first recorded pose and is sampled at every recorded
+    pose timestamp. Errors are accumulated as the simulation runs, so no trajectory of
+    every candidate at every pose is kept.
+
+    Args:
+        cmd_ts: Command timestamps in nanoseconds, sorted.
+        cmd_linear: Recorded ``linear.x`` of each command.
+        cmd_angular: Recorded ``angular.z`` of each command.
+        pose_ts: Recorded pose timestamps in nanoseconds, sorted.
+        pose: Recorded pose columns with at least ``x``, ``y`` and ``theta``.
+        step: Integration step in nanoseconds.
+        linear_scale: Candidate linear scale factor(s), scalar or array.
+        angular_scale: Candidate angular scale factor(s), broadcast against linear_scale.
+        reference_scale: The ``(linear, angular)`` scale factors the commands were
+            recorded with.
+
+    Returns:
+        dict: ``position_rmse``, ``heading_rmse`` and ``final_position_error``, each with
+        one element per candidate.
+
+    Raises:
+        ValueError: If there are no poses, or the commands do not fit ``reference_scale``.
+    """
+    linear_scale, angular_scale = _candidates(linear_scale, angular_scale)
+    cmd_axes = _recover_axes(cmd_linear, cmd_angular, reference_scale)
+    recorded_x = np.asarray(pose['x'], dtype=np.float64)
+    recorded_y = np.asarray(pose['y'], dtype=np.float64)
+    recorded_theta = np.asarray(pose['theta'], dtype=np.float64)
+    if len(pose_ts) == 0:
+        raise ValueError('Cannot compare against an empty pose recording')
+    initial_pose = (recorded_x[0], recorded_y[0], recorded_theta[0])
+
+    position_sq = np.zeros(linear_scale.shape)
+    heading_sq = np.zeros(linear_scale.shape)
+    for i, (x, y, theta) in enumerate(_integrate(cmd_ts, cmd_axes, initial_pose, pose_ts,
+                                                 step, linear_scale, angular_scale)):
+        dx = x - recorded_x[i]
+        dy = y - recorded_y[i]
+        position_sq += dx * dx + dy * dy
+        heading = theta - recorded_theta[i]
+        heading_sq += np.arctan2(np.sin(heading), np.cos(heading)) ** 2
+
+    return {
+        'position_rmse': np.sqrt(position_sq / len(pose_ts)),
+        'heading_rmse': np.sqrt(heading_sq / len(pose_ts)),
+        'final_position_error': np.hypot(dx, dy),
+    }
+
+
+def replay_bag(path, linear_scale=LINEAR_SCALE, angular_scale=ANGULAR_SCALE,
+               step: int = UPDATE_PERIOD, cmd_topic: str = CMD_TOPIC,
+               pose_topic: str = POSE_TOPIC,
+               reference_scale: tuple = (LINEAR_SCALE, ANGULAR_SCALE)) -> dict:
+    """
+    Replay a bag's commands through the simulator and score them against its poses.
+
+    Args:
+        path: Path to the bag directory.
+        linear_scale: Candidate linear scale factor(s), scalar or array.
+        angular_scale: Candidate angular scale factor(s), broadcast against linear_scale.
+        step: Integration step in nanoseconds.
+        cmd_topic: The ``geometry_msgs/msg/Twist`` command topic.
+        pose_topic: The ``turtlesim/msg/Pose`` topic.
+        reference_scale: The ``(linear, angular)`` scale factors the commands were
+            recorded with.
+
+    Returns:
+        dict: See :func:`trajectory_error`.
+
+    Raises:
+        ValueError: If the bag lacks either topic, or see :func:`trajectory_error`.
+    """
+    with BagReader(path) as bag:
+        for topic in (cmd_topic, pose_topic):
+            if topic not in bag.topics:
+                raise ValueError(f'Bag {path} has no {topic} recording')
+        cmd_ts, cmd = read_topic(bag, cmd_topic)
+        pose_ts, pose = read_topic(bag, pose_topic)
+    return trajectory_error(cmd_ts, cmd['linear_x'], cmd['angular_z'], pose_ts, pose, step,
+                            linear_scale, angular_scale, reference_scale)
+
+
+def main(args=None):
+    """
+    Sweep gamepad scale factors against a recorded bag and print the best candidates.
+
+    Every combination of the given linear and angular scale factors is simulated.
+    """
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument('bag', help='path to the bag directory')
+    parser.add_argument('--linear-scale', type=float, nargs='+', default=[LINEAR_SCALE],
+                        help='candidate linear scale factors')
+    parser.add_argument('--angular-scale', type=float, nargs='+', default=[ANGULAR_SCALE],
+                        help='candidate angular scale factors')
+    parser.add_argument('--reference-scale', type=float, nargs=2, required=True,
+                        metavar=('LINEAR', 'ANGULAR'),
+                        help='linear and angular scale factors the bag was recorded with, '
+                             f'e.g. {LINEAR_SCALE} {ANGULAR_SCALE} for the gamepad or '
+                             '2.0 2.0 for turtle_teleop_key')
+    parser.add_argument('--step', type=float, default=UPDATE_PERIOD / 1e9,
+                        help='integration step in seconds')
+    parser.add_argument('--top', type=int, default=10, help='number of candidates to print')
+    parsed = parser.parse_args(args)
+
+    linear, angular = np.meshgrid(parsed.linear_scale, parsed.angular_scale, indexing='ij')
+    linear, angular = linear.ravel(), angular.ravel()
+    result = replay_bag(parsed.bag, linear, angular, int(parsed.step * 1e9),
+                        reference_scale=tuple(parsed.reference_scale))
+
+    print(f'{"linear":>10} {"angular":>10} {"pos rmse":>10} {"head rmse":>10} {"final":>10}')
+    for i in np.argsort(result['position_rmse'])[:parsed.top]:
+        print(f'{linear[i]:10.4f} {angular[i]:10.4f} {result["position_rmse"][i]:10.4f} '
+              f'{result["heading_rmse"][i]:10.4f} {result["final_position_error"][i]:10.4f}')
+
+
+# Run the script if executed directly (not imported as a module)
+if __name__ == '__main__':
+    main()
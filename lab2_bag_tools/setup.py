@@ -0,0 +1,30 @@
+from setuptools import find_packages, setup
+
+package_name = 'lab2_bag_tools'
+
+setup(
+    name=package_name,
+    version='0.0.0',
+    packages=find_packages(exclude=['test']),
+    data_files=[
+        ('share/ament_index/resource_index/packages',
+            ['resource/' + package_name]),
+        ('share/' + package_name, ['package.xml']),
+    ],
+    install_requires=['setuptools', 'numpy', 'PyYAML'],
+    zip_safe=True,
+    maintainer='m3',
+    maintainer_email='sxquick1@gmail.com',
+    description='Offline tools for reading and analyzing the lab2 rosbag2 recordings',
+    license='TODO: License declaration',
+    tests_require=['pytest'],
+    entry_points={
+        'console_scripts': [
+            'bag_analyze = lab2_bag_tools.analytics:main',
+            'bag_cache = lab2_bag_tools.cache:main',
+            'bag_info = lab2_bag_tools.reader:main',
+            'bag_rewrite = lab2_bag_tools.rewrite:main',
+            'bag_simulate = lab2_bag_tools.simulator:main',
+        ],
+    },
+)
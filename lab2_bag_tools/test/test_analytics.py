@@ -0,0 +1,93 @@
+import math
+from pathlib import Path
+import shutil
+import struct
+
+from lab2_bag_tools.analytics import analyze_bag, analyze_directory, merge_asof
+from lab2_bag_tools.reader import TopicInfo
+from lab2_bag_tools.rewrite import BagWriter
+import numpy as np
+import pytest
+
+BAG_FILES = Path(__file__).resolve().parents[2] / 'lab2' / 'bag_files'
+SUBSET = BAG_FILES / 'subset'
+CMD_ONLY = BAG_FILES / 'rosbag2_2025_01_21-21_33_29'
+CMD_VEL = '/turtle1/cmd_vel'
+POSE = '/turtle1/pose'
+
+HEADER = b'\x00\x01\x00\x00'
+
+
+def test_subset():
+    result = analyze_bag(SUBSET)
+    assert result['cmd_count'] == 9
+    assert result['pose_count'] == 759
+    assert result['error'] == ''
+    assert result['unmatched_commands'] == 0
+    commands = result['commands']
+    assert len(commands) == 9
+    assert not np.isnan(commands['latency_s']).any()
+    assert (commands['latency_s'] >= 0).all()
+    assert result['path_length'] > 0
+
+    # Batch boundaries must not change anything
+    small = analyze_bag(SUBSET, batch_size=1)
+    for field in ('timestamp', 'linear_x', 'linear_y', 'angular_z', 'latency_s'):
+        np.testing.assert_array_equal(small['commands'][field], commands[field])
+    for field in ('duration_s', 'path_length', 'linear_rmse', 'angular_rmse'):
+        assert small[field] == pytest.approx(result[field])
+
+
+def test_commands_without_poses():
+    result = analyze_bag(CMD_ONLY)
+    assert result['cmd_count'] == 125
+    assert result['pose_count'] == 0
+    assert result['unmatched_commands'] == 125
+    for field in ('path_length', 'latency_mean_s', 'linear_rmse', 'angular_rmse'):
+        assert math.isnan(result[field])
+
+
+def test_reversing_matches_reported_speed(tmp_path):
+    # turtlesim reports the speed, so a reversing turtle has a positive linear_velocity
+    start = 1_000_000_000
+    with BagWriter(tmp_path / 'reverse') as writer:
+        writer.add_topic(TopicInfo(CMD_VEL, 'geometry_msgs/msg/Twist'))
+        writer.add_topic(TopicInfo(POSE, 'turtlesim/msg/Pose'))
+        writer.write(CMD_VEL, start, HEADER + struct.pack('<6d', -2, 0, 0, 0, 0, 0.5))
+        for i in range(1, 4):
+            writer.write(POSE, start + i * 16_000_000,
+                         HEADER + struct.pack('<5f', 5.0 - 0.032 * i, 5.0, 0, 2.0, 0.5))
+
+    result = analyze_bag(tmp_path / 'reverse')
+    assert result['unmatched_commands'] == 0
+    assert result['commands']['latency_s'][0] == pytest.approx(0.016)
+    assert result['linear_rmse'] == pytest.approx(0)
+
+
+def test_directory_with_corrupt_bag(tmp_path):
+    shutil.copytree(SUBSET, tmp_path / 'a_subset')
+    shutil.copytree(SUBSET, tmp_path / 'b_corrupt')
+    (tmp_path / 'b_corrupt' / 'subset_0.db3').write_bytes(b'not a database')
+    shutil.copytree(CMD_ONLY, tmp_path / 'c_cmd_only')
+
+    results = analyze_directory(tmp_path, workers=2)
+    names = [Path(result['bag']).name for result in results]
+    assert names == ['a_subset', 'b_corrupt', 'c_cmd_only']
+    assert results[0]['error'] == '' and results[0]['cmd_count'] == 9
+    assert results[1]['error']
+    assert len(results[1]['commands']) == 0
+    assert results[2]['error'] == '' and results[2]['cmd_count'] == 125
+
+
+def test_merge_asof():
+    left = np.array([0, 5, 10, 15, 30])
+    right = np.array([4, 10, 20])
+
+    assert list(merge_asof(left, right)) == [-1, 0, 1, 1, 2]
+    assert list(merge_asof(left, right, tolerance=3)) == [-1, 0, 1, -1, -1]
+    assert list(merge_asof(left, right, direction='forward')) == [0, 1, 1, 2, -1]
+    assert list(merge_asof(left, right, tolerance=4,
+                           direction='forward')) == [0, -1, 1, -1, -1]
+    assert list(merge_asof(left, right[:0])) == [-1] * 5
+    with pytest.raises(ValueError):
+        merge_asof(left, right, direction='nearest')
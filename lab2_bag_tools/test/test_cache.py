@@ -0,0 +1,62 @@
+from pathlib import Path
+import shutil
+import sqlite3
+
+from lab2_bag_tools.cache import BagCache
+from lab2_bag_tools.cdr import read_topic
+from lab2_bag_tools.reader import BagReader
+import numpy as np
+
+SUBSET = Path(__file__).resolve().parents[2] / 'lab2' / 'bag_files' / 'subset'
+POSE = '/turtle1/pose'
+CMD_VEL = '/turtle1/cmd_vel'
+
+
+def assert_matches_bag(tables, bag_path):
+    with BagReader(bag_path) as bag:
+        assert set(tables) == set(bag.topics)
+        for name, table in tables.items():
+            timestamps, columns = read_topic(bag, name)
+            assert table.type == bag.topics[name].type
+            np.testing.assert_array_equal(table.timestamps, timestamps)
+            assert table.columns.keys() == columns.keys()
+            for field, values in columns.items():
+                assert table[field].dtype == values.dtype
+                np.testing.assert_array_equal(table[field], values)
+
+
+def test_load_matches_bag(tmp_path):
+    cache = BagCache(tmp_path / 'cache')
+    tables = cache.load(SUBSET)
+    assert len(tables[POSE]) == 759
+    assert len(tables[CMD_VEL]) == 9
+    assert_matches_bag(tables, SUBSET)
+
+    # A second load is served from the same entry
+    assert (cache.cache_dir / cache.key(SUBSET)).is_dir()
+    assert_matches_bag(cache.load(SUBSET), SUBSET)
+
+
+def test_changed_bag_rebuilds_entry(tmp_path):
+    bag_path = tmp_path / 'subset'
+    shutil.copytree(SUBSET, bag_path)
+    cache = BagCache(tmp_path / 'cache')
+    old_key = cache.key(bag_path)
+    assert len(cache.load(bag_path)[CMD_VEL]) == 9
+
+    conn = sqlite3.connect(bag_path / 'subset_0.db3')
+    with conn:
+        conn.execute('DELETE FROM messages WHERE topic_id = '
+                     '(SELECT id FROM topics WHERE name = ?) '
+                     'AND id NOT IN (SELECT MIN(id) FROM messages GROUP BY topic_id)',
+                     (CMD_VEL,))
+    conn.close()
+
+    new_key = cache.key(bag_path)
+    assert new_key != old_key
+    tables = cache.load(bag_path)
+    assert len(tables[CMD_VEL]) == 1
+    assert len(tables[POSE]) == 759
+    assert_matches_bag(tables, bag_path)
+    assert (cache.cache_dir / new_key).is_dir()
+    assert not (cache.cache_dir / old_key).exists()
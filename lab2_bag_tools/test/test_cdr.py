@@ -0,0 +1,107 @@
+from pathlib import Path
+import struct
+
+from lab2_bag_tools.cdr import decode_batch, decode_messages, read_topic
+from lab2_bag_tools.reader import BagReader
+import numpy as np
+import pytest
+
+SUBSET = Path(__file__).resolve().parents[2] / 'lab2' / 'bag_files' / 'subset'
+POSE_TYPE = 'turtlesim/msg/Pose'
+TWIST_TYPE = 'geometry_msgs/msg/Twist'
+JOY_TYPE = 'sensor_msgs/msg/Joy'
+
+
+def pose_blob(values, little_endian=True, padding=b''):
+    order = '<' if little_endian else '>'
+    header = b'\x00\x01\x00\x00' if little_endian else b'\x00\x00\x00\x00'
+    return header + struct.pack(order + '5f', *values) + padding
+
+
+def joy_blob(axes, buttons, frame_id='joy'):
+    # Header stamp, frame_id, then the axes and buttons sequences, all 4-byte aligned
+    frame = frame_id.encode() + b'\x00'
+    payload = struct.pack('<iiI', 12, 34, len(frame)) + frame
+    payload += b'\x00' * (-len(payload) % 4)
+    payload += struct.pack(f'<I{len(axes)}f', len(axes), *axes)
+    payload += struct.pack(f'<I{len(buttons)}i', len(buttons), *buttons)
+    return b'\x00\x01\x00\x00' + payload
+
+
+def assert_columns_equal(actual, expected):
+    assert actual.keys() == expected.keys()
+    for name in expected:
+        assert actual[name].dtype == expected[name].dtype
+        np.testing.assert_array_equal(actual[name], expected[name])
+
+
+def test_decode_batch_matches_decode_messages():
+    with BagReader(SUBSET) as bag:
+        for topic in ('/turtle1/pose', '/turtle1/cmd_vel'):
+            blobs = [msg.data for msg in bag.messages([topic])]
+            msg_type = bag.topics[topic].type
+            columns = decode_batch(msg_type, blobs)
+            assert_columns_equal(columns, decode_messages(msg_type, blobs))
+            assert all(column.flags.c_contiguous for column in columns.values())
+
+            timestamps, streamed = read_topic(bag, topic, batch_size=100)
+            assert len(timestamps) == len(blobs)
+            assert_columns_equal(streamed, columns)
+
+
+def test_big_endian_poses():
+    values = [(1.5, 2.5, -0.25, 1.0, -2.0), (3.0, 4.0, 0.5, 0.0, 2.0)]
+    expected = np.array(values, np.float32)
+
+    columns = decode_batch(POSE_TYPE, [pose_blob(v, little_endian=False) for v in values])
+    assert columns['x'].dtype == np.float32
+    np.testing.assert_array_equal(columns['x'], expected[:, 0])
+    np.testing.assert_array_equal(columns['angular_velocity'], expected[:, 4])
+
+    # Mixed byte orders take the per-message path and give the same values
+    mixed = decode_batch(POSE_TYPE, [pose_blob(values[0], little_endian=False),
+                                     pose_blob(values[1])])
+    assert_columns_equal(mixed, columns)
+
+
+def test_mixed_sizes_fall_back():
+    values = [(1.0, 2.0, 3.0, 4.0, 5.0), (6.0, 7.0, 8.0, 9.0, 10.0)]
+    blobs = [pose_blob(values[0]), pose_blob(values[1], padding=b'\x00' * 4)]
+    columns = decode_batch(POSE_TYPE, blobs)
+    np.testing.assert_array_equal(columns['theta'], np.float32([3.0, 8.0]))
+
+    # Uniformly padded messages still take the fast path
+    padded = decode_batch(POSE_TYPE, [pose_blob(v, padding=b'\x00' * 4) for v in values])
+    assert_columns_equal(padded, columns)
+
+
+def test_empty_batch():
+    columns = decode_batch(TWIST_TYPE, [])
+    assert set(columns) == {'linear_x', 'linear_y', 'linear_z',
+                            'angular_x', 'angular_y', 'angular_z'}
+    assert all(len(column) == 0 and column.dtype == np.float64
+               for column in columns.values())
+
+
+def test_joy():
+    blobs = [joy_blob([0.5, -1.0], [1, 0, 1]), joy_blob([], []), joy_blob([0.25], [], '')]
+    columns = decode_batch(JOY_TYPE, blobs)
+
+    assert list(columns['header_stamp_sec']) == [12, 12, 12]
+    assert list(columns['header_frame_id']) == ['joy', 'joy', '']
+    np.testing.assert_array_equal(columns['axes'][0], np.float32([0.5, -1.0]))
+    np.testing.assert_array_equal(columns['buttons'][0], [1, 0, 1])
+    assert len(columns['axes'][1]) == 0 and len(columns['buttons'][1]) == 0
+    np.testing.assert_array_equal(columns['axes'][2], np.float32([0.25]))
+    assert len(columns['buttons'][2]) == 0
+
+
+def test_rejects_other_representations():
+    # 0x0003 is PL_CDR_LE, which has a different layout
+    blob = b'\x00\x03' + pose_blob((1.0, 2.0, 3.0, 4.0, 5.0))[2:]
+    with pytest.raises(ValueError, match='0003'):
+        decode_batch(POSE_TYPE, [blob])
+    with pytest.raises(ValueError, match='0003'):
+        decode_batch(POSE_TYPE, [pose_blob((1.0, 2.0, 3.0, 4.0, 5.0)), blob])
+    with pytest.raises(ValueError, match='0003'):
+        decode_messages(JOY_TYPE, [b'\x00\x03' + joy_blob([], [])[2:]])
@@ -0,0 +1,58 @@
+from pathlib import Path
+
+from lab2_bag_tools.reader import BagReader
+from lab2_bag_tools.rewrite import rewrite
+
+SUBSET = Path(__file__).resolve().parents[2] / 'lab2' / 'bag_files' / 'subset'
+POSE = '/turtle1/pose'
+CMD_VEL = '/turtle1/cmd_vel'
+
+
+def test_count_matches_messages_in_window():
+    with BagReader(SUBSET) as bag:
+        start = bag.metadata.starting_time + 3_000_000_000
+        end = start + 2_000_000_000
+        for topics in (None, [POSE], [CMD_VEL]):
+            messages = list(bag.messages(topics, start, end))
+            assert messages
+            assert bag.count(topics, start, end) == len(messages)
+            assert all(start <= msg.timestamp < end for msg in messages)
+            if topics is not None:
+                assert {msg.topic for msg in messages} == set(topics)
+
+
+def test_whole_bag_matches_metadata():
+    with BagReader(SUBSET) as bag:
+        assert bag.count() == bag.metadata.message_count == 768
+        assert bag.count([POSE]) == 759
+        assert bag.count([CMD_VEL]) == 9
+
+
+def test_missing_topic_yields_nothing():
+    with BagReader(SUBSET) as bag:
+        assert list(bag.messages(['/turtle1/missing'])) == []
+        assert bag.count(['/turtle1/missing']) == 0
+
+
+def test_batches_respect_batch_size():
+    with BagReader(SUBSET) as bag:
+        batches = list(bag.batches([CMD_VEL], batch_size=4))
+        assert [len(batch) for batch in batches] == [4, 4, 1]
+        assert [msg for batch in batches for msg in batch] == list(bag.messages([CMD_VEL]))
+
+
+def test_multi_file_bag_reads_in_timestamp_order(tmp_path):
+    split = tmp_path / 'split'
+    rewrite([SUBSET], split, max_file_duration=2_000_000_000)
+
+    with BagReader(SUBSET) as source, BagReader(split) as bag:
+        assert len(bag.files) > 1
+        messages = list(bag.messages(batch_size=10))
+        timestamps = [msg.timestamp for msg in messages]
+        assert timestamps == sorted(timestamps)
+        assert messages == list(source.messages())
+
+        start = source.metadata.starting_time + 1_000_000_000
+        end = start + 5_000_000_000
+        assert list(bag.messages([POSE], start, end)) == list(source.messages([POSE], start, end))
+        assert bag.count([POSE], start, end) == source.count([POSE], start, end)
@@ -0,0 +1,87 @@
+from pathlib import Path
+import shutil
+import sqlite3
+
+from lab2_bag_tools.reader import BagMetadata, BagReader
+from lab2_bag_tools.rewrite import rewrite
+import pytest
+import yaml
+
+SUBSET = Path(__file__).resolve().parents[2] / 'lab2' / 'bag_files' / 'subset'
+POSE = '/turtle1/pose'
+CMD_VEL = '/turtle1/cmd_vel'
+
+
+def test_rewrite_topic_and_time_window(tmp_path):
+    with BagReader(SUBSET) as source:
+        start = source.metadata.starting_time + 2_000_000_000
+        end = source.metadata.starting_time + 5_000_000_000
+        expected = list(source.messages([POSE], start, end))
+    assert expected
+
+    output = tmp_path / 'window'
+    rewrite([SUBSET], output, topics=[POSE], start=start, end=end, batch_size=16)
+
+    with open(output / 'metadata.yaml') as f:
+        info = yaml.safe_load(f)['rosbag2_bagfile_information']
+    assert info['message_count'] == len(expected)
+    assert info['starting_time']['nanoseconds_since_epoch'] == expected[0].timestamp
+    assert (info['duration']['nanoseconds']
+            == expected[-1].timestamp - expected[0].timestamp)
+    counts = {entry['topic_metadata']['name']: entry['message_count']
+              for entry in info['topics_with_message_count']}
+    assert counts == {POSE: len(expected)}
+
+    with BagReader(output) as result:
+        written = list(result.messages())
+    assert [msg.topic for msg in written] == [POSE] * len(expected)
+    assert [msg.timestamp for msg in written] == [msg.timestamp for msg in expected]
+    assert [msg.data for msg in written] == [msg.data for msg in expected]
+
+
+def test_rewrite_split_by_duration(tmp_path):
+    with BagReader(SUBSET) as source:
+        expected = list(source.messages())
+
+    output = tmp_path / 'split'
+    max_duration = 3_000_000_000
+    metadata = rewrite([SUBSET], output, max_file_duration=max_duration)
+
+    assert len(metadata.relative_file_paths) > 1
+    assert metadata.message_count == len(expected)
+    assert sum(entry['message_count'] for entry in metadata.files) == len(expected)
+    assert metadata.topics[POSE].message_count == 759
+    assert metadata.topics[CMD_VEL].message_count == 9
+    for entry in metadata.files:
+        assert entry['duration'] < max_duration
+        assert (output / entry['path']).exists()
+
+    with BagReader(output) as result:
+        assert list(result.messages()) == expected
+
+
+def test_rewrite_conflicting_types_leaves_no_output(tmp_path):
+    other = tmp_path / 'other'
+    shutil.copytree(SUBSET, other)
+    metadata = BagMetadata.from_file(other / 'metadata.yaml')
+    metadata.topics[POSE].type = 'geometry_msgs/msg/Pose'
+    metadata.to_file(other / 'metadata.yaml')
+
+    output = tmp_path / 'merged'
+    with pytest.raises(ValueError, match=POSE):
+        rewrite([SUBSET, other], output)
+    assert not output.exists()
+
+
+def test_rewrite_without_schema_table(tmp_path):
+    old = tmp_path / 'old'
+    shutil.copytree(SUBSET, old)
+    conn = sqlite3.connect(old / 'subset_0.db3')
+    conn.execute('DROP TABLE schema')
+    conn.commit()
+    conn.close()
+
+    with BagReader(old) as bag:
+        assert bag.ros_distro is None
+    metadata = rewrite([old], tmp_path / 'copy')
+    assert metadata.message_count == 768
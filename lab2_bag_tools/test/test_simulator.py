@@ -0,0 +1,29 @@
+from pathlib import Path
+
+from lab2_bag_tools.simulator import replay_bag
+import numpy as np
+import pytest
+
+BAG_FILES = Path(__file__).resolve().parents[2] / 'lab2' / 'bag_files'
+SUBSET = BAG_FILES / 'subset'
+
+# The lab2 bags were recorded with turtle_teleop_key, which sends 2.0 at full deflection
+TELEOP_KEY_SCALE = (2.0, 2.0)
+
+
+def test_replay_recorded_scale_tracks_poses():
+    linear = np.array([1.5, 2.0, 2.5])
+    result = replay_bag(SUBSET, linear, 2.0, reference_scale=TELEOP_KEY_SCALE)
+    assert result['position_rmse'].shape == (3,)
+    assert np.argmin(result['position_rmse']) == 1
+    assert result['position_rmse'][1] < 0.05
+
+
+def test_replay_rejects_wrong_reference_scale():
+    with pytest.raises(ValueError, match='stick position'):
+        replay_bag(SUBSET, reference_scale=(0.22, 2.8))
+
+
+def test_replay_requires_pose_topic():
+    with pytest.raises(ValueError, match='/turtle1/pose'):
+        replay_bag(BAG_FILES / 'rosbag2_2025_01_21-21_33_29', reference_scale=TELEOP_KEY_SCALE)
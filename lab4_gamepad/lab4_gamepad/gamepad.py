@@ -8,6 +8,9 @@ from rclpy.node import Node  # Base class for creating ROS 2 nodes
 # Import message types
 from sensor_msgs.msg import Joy  # Message type for joystick (gamepad) inputs
 from geometry_msgs.msg import Twist  # Message type for velocity commands
+
+# Axis-to-velocity mapping, shared with the offline simulator
+from lab4_gamepad.mapping import axes_to_velocity
  
 class Gamepad(Node):
     """
@@ -54,8 +57,7 @@ class Gamepad(Node):
         # TODO: Map joystick axes to robot velocity:
         # The left stick up/down controls linear speed (forward/backward)
         # The right stick left/right controls angular speed (rotation)
-        Tmsg.linear.x = msg.axes[1]*0.22
-        Tmsg.angular.z = msg.axes[3]*2.8
+        Tmsg.linear.x, Tmsg.angular.z = axes_to_velocity(msg.axes)
  
         # TODO: Publish the velocity command to the 'cmd_vel' topic
         self.publisher_.publish(Tmsg)
@@ -0,0 +1,34 @@
+"""
+Mapping from gamepad axes to velocity commands.
+
+Kept separate from the Gamepad node so that it can be used (and tuned) without ROS 2,
+for example by the offline simulator in lab2_bag_tools.
+"""
+
+# Index of the left stick up/down axis, which controls linear speed (forward/backward)
+LINEAR_AXIS = 1
+# Index of the right stick left/right axis, which controls angular speed (rotation)
+ANGULAR_AXIS = 3
+
+# Scale factors from axis values (-1 to 1) to velocities in m/s and rad/s
+LINEAR_SCALE = 0.22
+ANGULAR_SCALE = 2.8
+
+
+def axes_to_velocity(axes, linear_scale=LINEAR_SCALE, angular_scale=ANGULAR_SCALE):
+    """
+    Convert joystick axis values into linear and angular velocities.
+
+    Works on plain sequences as well as numpy arrays, so a whole batch of axis readings
+    (or of scale factors) can be converted at once.
+
+    Args:
+        axes: The axis values, indexed like ``Joy.axes``.
+        linear_scale: Linear velocity at full stick deflection.
+        angular_scale: Angular velocity at full stick deflection.
+
+    Returns:
+        tuple: The linear velocity (``Twist.linear.x``) and angular velocity
+        (``Twist.angular.z``).
+    """
+    return axes[LINEAR_AXIS] * linear_scale, axes[ANGULAR_AXIS] * angular_scale